@@ -1,9 +1,16 @@
 import copy
 import fnmatch
-from collections import OrderedDict
+import re
+import types
+from collections import OrderedDict, defaultdict
 from typing import Mapping, Union
 
-from .utils import split_list
+from .utils import split_list, stack_list, unstack
+
+_SENTINEL = object()
+
+# Immutable types, which are shared instead of copied
+_ATOMIC_TYPES = frozenset((int, float, complex, bool, str, bytes, type(None)))
 
 
 class Batch(Mapping):
@@ -11,10 +18,26 @@ class Batch(Mapping):
     Generic class implementing a batch as a dictionary of objects.
     It supports every member functions of the underlying objects.
     """
-    INTERNAL_MEMBER_PREFIX = "_Batch"
+    # Without an instance __dict__ a batch only holds its member dictionary and a few control fields
+    __slots__ = ("_data", "_default", "_in_place", "_version", "_flat_cache", "__weakref__")
+    _SLOT_NAMES = frozenset(__slots__)
 
     """ ====================================== INSTANTIATE ====================================== """
 
+    def __init_subclass__(cls, **kwargs):
+        """
+        Checks that subclasses keep the slot-based layout.
+        An instance __dict__ would shadow the member view returned by the __dict__ property.
+        """
+        super().__init_subclass__(**kwargs)
+        slots = cls.__dict__.get("__slots__")
+        if slots is None:
+            raise TypeError(f"Subclass {cls.__name__} of Batch must declare __slots__, e.g. __slots__ = ()")
+        slots = (slots,) if isinstance(slots, str) else tuple(slots)
+        if "__dict__" in slots:
+            raise TypeError(f"Subclass {cls.__name__} of Batch must not declare a __dict__ slot")
+        cls._SLOT_NAMES = cls._SLOT_NAMES | frozenset(slots)
+
     def __init__(self, *args, default=None, **kwargs):
         """
         Constructing a new batch.
@@ -22,41 +45,28 @@ class Batch(Mapping):
         :param default: Default value constructor if a key is not found. Otherwise a KeyError is raised.
         :param kwargs: Batch elements as keyword arguments
         """
-        super().__init__()
-        self.__default = default
-        self.__dict__.update(**kwargs)
-        self.__in_place = False
+        _set_default(self, default)
+        _set_data(self, kwargs)
+        _set_in_place(self, False)
+        _set_version(self, 0)
+        _set_flat_cache(self, None)
 
         # Batch elements as dictionary
         if len(args) == 1 and isinstance(args[0], dict):
-            self.__dict__.update(**args[0])
-
-        # Set the operation functions
-        def make_func(name, in_place):
-            return lambda caller, *args: caller._get_member_attribute(name=name, in_place=in_place)(*args)
-
-        for name in [
-            # Unary operators
-            "__not__", "__abs__", "__index__", "__inv__", "__invert__", "__neg__", "__pos__",
-
-            # Binary operators
-            "__add__", "__and__", "__concat__", "__floordiv__", "__lshift__", "__mod__", "__mul__",
-            "__or__", "__pow__", "__rshift__", "__sub__", "__truediv__", "__xor__", "__eq__",
-
-            # Reverse operators
-            "__radd__", "__rand__", "__rmul__",
-            "__ror__", "__rsub__", "__rxor__"]:
-            setattr(Batch, name, make_func(name, in_place=False))
-
-        for name in [
-            # In-place operators
-            "__iadd__", "__iand__", "__iconcat__", "__ifloordiv__", "__ilshift__", "__imod__", "__imul__",
-            "__ior__", "__ipow__", "__irshift__", "__isub__", "__itruediv__", "__ixor__"]:
-            setattr(Batch, name, make_func(name, in_place=True))
+            self._data.update(**args[0])
 
         # Batchify recursively
         self._batchify()
 
+    @property
+    def __dict__(self):
+        """
+        Members of the batch, kept for compatibility with `vars` and direct `__dict__` access.
+        The view is read-only, members must be set through the batch to keep its key cache valid.
+        :return: Read-only view of the members
+        """
+        return types.MappingProxyType(self._data)
+
     @classmethod
     def from_dict(cls, data):
         """
@@ -64,13 +74,13 @@ class Batch(Mapping):
         :param data: Dictionary containing the data
         :return: Created batch
         """
-        other = cls()
+        other_data = dict()
         for key, value in data.items():
             if isinstance(value, (dict, Batch)):
-                other[key] = cls.from_dict(value)
+                other_data[key] = cls.from_dict(value)
             else:
-                other[key] = value
-        return other
+                other_data[key] = value
+        return cls._from_data(other_data)
 
     @classmethod
     def from_tensor(cls, data, cat_map, dim=0, split_fn=split_list):
@@ -79,15 +89,19 @@ class Batch(Mapping):
         :param data: Tensor containing the data
         :param cat_map: Dictionary of the member names and their sizes
         :param dim: Dimension along which to split the tensor
-        :param split_fn: Split function
+        :param split_fn: Split function, called once per level with the list of section sizes
         :return: Created batch
         """
+        # Split all members with a single call, the remainder is appended as the last section
+        sizes = [cls._cat_map_size(value) for value in cat_map.values()]
+        splits = split_fn(data, sizes + [data.shape[dim] - sum(sizes)], dim)
+
         other = cls()
-        for key, value in cat_map.items():
+        for (key, value), split in zip(cat_map.items(), splits):
             if isinstance(value, int):
-                other[key], data = split_fn(data, [value, data.shape[dim] - value], dim)
+                other[key] = split
             if isinstance(value, OrderedDict):
-                other[key] = cls.from_tensor(data, value, dim=dim, split_fn=split_fn)
+                other[key] = cls.from_tensor(split, value, dim=dim, split_fn=split_fn)
         return other
 
     @classmethod
@@ -97,18 +111,20 @@ class Batch(Mapping):
         :param args: Batches to be merged
         :return: Created batch
         """
-        other = cls()
-
-        batch_args = [arg for arg in list(args)]
-        all_keys = {key for batch_arg in batch_args for key in batch_arg.keys()}
+        # Collect the members of all batches in a single pass
+        columns = defaultdict(list)
+        for batch_arg in args:
+            for key, value in batch_arg.items():
+                columns[key].append(value)
 
-        for key in all_keys:
-            other.__dict__[key] = [batch_arg[key] for batch_arg in batch_args if key in batch_arg]
-
-        # Convert all member batch lists as well
-        for key in other.keys():
-            if isinstance(other[key][0], Batch):
-                other[key] = cls.from_batch_list(*other[key])
+        other = cls()
+        other_data = other._data
+        for key, column in columns.items():
+            # Convert all member batch lists as well
+            if isinstance(column[0], Batch):
+                other_data[key] = cls.from_batch_list(*column)
+            else:
+                other_data[key] = column
         return other
 
     def copy(self, deep=True):
@@ -121,12 +137,16 @@ class Batch(Mapping):
         else:
             return copy.copy(self)
 
-    def __deepcopy__(self, memo=None):
-        other = Batch()
-        for key in self.keys():
-            other[key] = copy.deepcopy(self[key], memo=memo)
+    def __copy__(self):
+        other = type(self)._from_data(dict(self._data))
+        _set_default(other, self._default)
         return other
 
+    def __deepcopy__(self, memo=None):
+        deepcopy, atomic_types = copy.deepcopy, _ATOMIC_TYPES
+        return Batch._from_data({key: value if type(value) in atomic_types else deepcopy(value, memo)
+                                 for key, value in self._data.items()})
+
     """ ====================================== PROCESSING ====================================== """
 
     def map(self, fn, *args, **kwargs):
@@ -136,13 +156,41 @@ class Batch(Mapping):
         :return: Batch of the results
         """
         other = Batch()
-        for key in self.keys():
-            if isinstance(self[key], Batch):
-                other[key] = self[key].map(fn, *args, **kwargs)
+        batch_cls, _isinstance = Batch, isinstance
+
+        # Walk the batch with an explicit stack of (output members, input member iterator) pairs
+        stack = [(other._data, iter(self._data.items()))]
+        while stack:
+            other_data, items = stack[-1]
+            for key, value in items:
+                if _isinstance(value, batch_cls):
+                    other_data[key] = sub_batch = batch_cls._from_data({})
+                    stack.append((sub_batch._data, iter(value._data.items())))
+                    break
+                other_data[key] = fn(value, *args, **kwargs)
             else:
-                other[key] = fn(self[key], *args, **kwargs)
+                stack.pop()
         return other
 
+    def vmap(self, fn, *args, stack_axis=0, **kwargs):
+        """
+        Applies a vectorised function to all members of the batch with a single call.
+        If all members are NumPy arrays or PyTorch tensors of the same shape and dtype, then they are stacked,
+        the function is called once on the stacked tensor and the result is split back into the members.
+        Otherwise, the function is applied to each member by map.
+        :param fn: Function to be applied, it must not mix or reduce the values along the stacked axis
+        :param stack_axis: Axis along which the members are stacked
+        :return: Batch of the results
+        """
+        stacked = stack_list(list(self._data.values()), dim=stack_axis)
+        if stacked is None:
+            return self.map(fn, *args, **kwargs)
+
+        result = fn(stacked, *args, **kwargs)
+        assert result.shape[stack_axis] == len(self._data), \
+            f"The function must keep the size of the stacked axis {stack_axis}"
+        return Batch._from_data(dict(zip(self._data.keys(), unstack(result, dim=stack_axis))))
+
     def map_keys(self, fn, *args, **kwargs):
         """
         Applies a function to all keys of the batch
@@ -164,12 +212,21 @@ class Batch(Mapping):
         :return: Batch of the results
         """
         other = Batch()
-        for key in self.keys():
-            if isinstance(self[key], Batch):
-                other[key] = self[key].filter(fn, *args, **kwargs)
+        batch_cls, _isinstance = Batch, isinstance
+
+        # Walk the batch with an explicit stack of (output members, input member iterator) pairs
+        stack = [(other._data, iter(self._data.items()))]
+        while stack:
+            other_data, items = stack[-1]
+            for key, value in items:
+                if _isinstance(value, batch_cls):
+                    other_data[key] = sub_batch = batch_cls._from_data({})
+                    stack.append((sub_batch._data, iter(value._data.items())))
+                    break
+                if fn(value, *args, **kwargs):
+                    other_data[key] = value
             else:
-                if fn(self[key], *args, **kwargs):
-                    other[key] = self[key]
+                stack.pop()
         return other
 
     def flatten(self, separator="."):
@@ -177,13 +234,21 @@ class Batch(Mapping):
         Flattens the batch into a single batch
         :return: The flattened batch
         """
-        other = Batch()
-        for key in self.keys():
-            if isinstance(self[key], Batch):
-                other.update(self[key].flatten(separator=separator).add_prefix(key + separator))
+        other_data = dict()
+        batch_cls, _isinstance = Batch, isinstance
+
+        # Walk the batch with an explicit stack of (key prefix, input member iterator) pairs
+        stack = [("", iter(self._data.items()))]
+        while stack:
+            prefix, items = stack[-1]
+            for key, value in items:
+                if _isinstance(value, batch_cls):
+                    stack.append((f"{prefix}{key}{separator}", iter(value._data.items())))
+                    break
+                other_data[prefix + key] = value
             else:
-                other[key] = self[key]
-        return other
+                stack.pop()
+        return Batch._from_data(other_data)
 
     def add_prefix(self, prefix):
         """
@@ -243,11 +308,20 @@ class Batch(Mapping):
         :return: The dictionary
         """
         other = dict()
-        for key in self.keys():
-            if isinstance(self[key], Batch):
-                other[key] = self[key].to_dict()
+        batch_cls, _isinstance = Batch, isinstance
+
+        # Walk the batch with an explicit stack of (output dictionary, input member iterator) pairs
+        stack = [(other, iter(self._data.items()))]
+        while stack:
+            other_dict, items = stack[-1]
+            for key, value in items:
+                if _isinstance(value, batch_cls):
+                    other_dict[key] = sub_dict = dict()
+                    stack.append((sub_dict, iter(value._data.items())))
+                    break
+                other_dict[key] = value
             else:
-                other[key] = self[key]
+                stack.pop()
         return other
 
     def to_list(self):
@@ -273,11 +347,23 @@ class Batch(Mapping):
     """ ====================================== MEMBER ACCESS ====================================== """
 
     def __contains__(self, key):
-        try:
-            return len(self[key]) > 0
-        except KeyError:
+        data = self._data
+        if key in data:
+            return True
+        if not isinstance(key, str):
             return False
 
+        # Check sub-keys separated by '.' character, without creating members by the default constructor
+        while "." in key:
+            root_key, key = key.split(".", maxsplit=1)
+            sub_item = data.get(root_key)
+            if not isinstance(sub_item, Batch):
+                return False
+            data = sub_item._data
+            if key in data:
+                return True
+        return False
+
     def __getitem__(self, index_or_key):
         """
         Accessing a member of the batch.
@@ -289,23 +375,32 @@ class Batch(Mapping):
         """
         if index_or_key is None:
             return self
-        elif isinstance(index_or_key, str):
+
+        # Exact types of the common single keys and indices are dispatched with a single lookup.
+        # The handlers are looked up by name, so subclasses can override them.
+        handler_name = _GETITEM_HANDLERS.get(type(index_or_key))
+        if handler_name is not None:
+            return getattr(self, handler_name)(index_or_key)
+
+        if isinstance(index_or_key, str):
             return self._getitem_key(key=index_or_key)
         elif isinstance(index_or_key, int):
             return self._getitem_index(index=index_or_key)
         elif isinstance(index_or_key, (tuple, list)):
             if len(index_or_key) == 0:
                 return Batch()
-            if all(type(index_or_key[0]) == type(idx) for idx in index_or_key):
-                if isinstance(index_or_key[0], int):
+            first = index_or_key[0]
+            first_type = type(first)
+            if all(type(idx) is first_type for idx in index_or_key):
+                if isinstance(first, int):
                     return self._getitem_index(index=index_or_key)
-                elif isinstance(index_or_key[0], str):
+                elif isinstance(first, str):
                     other = Batch()
                     for key in index_or_key:
                         other[key] = self._getitem_key(key=key)
                     return other
                 else:
-                    raise NotImplementedError(f"Index type {type(index_or_key[0])} in {type(index_or_key)} not supported")
+                    raise NotImplementedError(f"Index type {first_type} in {type(index_or_key)} not supported")
             else: # If not all indices are of the same type, then we assume that the indices are slices or integers
                 assert all(isinstance(idx, (int, slice)) for idx in index_or_key), "Only slices and integers are supported"
                 return self._getitem_index(index=index_or_key)
@@ -319,8 +414,9 @@ class Batch(Mapping):
         :return: Extracted value
         """
         # Check if key in the dictionary
-        if key in self.__dict__:
-            return self.__dict__.__getitem__(key)
+        data = self._data
+        if key in data:
+            return data[key]
 
         # Check if the key refers to a subvalue separated by '.' character.
         if "." in key:
@@ -331,9 +427,10 @@ class Batch(Mapping):
                 pass
 
         # Check if default constructor is given
-        if self.__default is not None:
-            self.__dict__.__setitem__(key, self.__default())
-            return self.__dict__.__getitem__(key)
+        if self._default is not None:
+            data[key] = value = self._default()
+            _set_version(self, self._version + 1)
+            return value
 
         raise KeyError(f"Key {key} not found in {list(self.keys())}")
 
@@ -343,10 +440,7 @@ class Batch(Mapping):
         :param index: Index at the batch
         :return: Extracted value
         """
-        other = Batch()
-        for key in self.keys():
-            other.__dict__[key] = self.__dict__[key][index]
-        return other
+        return Batch._from_data({key: value[index] for key, value in self._data.items()})
 
     def query_wildcard(self, query):
         """
@@ -356,8 +450,12 @@ class Batch(Mapping):
         """
         if isinstance(query, str):
             query = [query]
+        if len(query) == 0:
+            return Batch()
 
-        queried_keys = [k for q in query for k in fnmatch.filter(self.keys(depth=-1), q)]
+        # Match every key once against the alternation of all queries
+        match = re.compile("|".join(f"(?:{fnmatch.translate(q)})" for q in query)).match
+        queried_keys = [k for k in self.keys(depth=-1) if match(k)]
         return self[queried_keys]
 
     def __setitem__(self, index_or_key, value):
@@ -394,17 +492,19 @@ class Batch(Mapping):
         :param value: Value to set
         :return: Extracted value
         """
+        data = self._data
+
         # Check if the key refers to a subvalue separated by '.' character.
         if "." in key:
             root_key, sub_key = key.split(".", maxsplit=1)
-            try:
-                sub_item = self[root_key]
-                if isinstance(sub_item, Batch):
-                    return sub_item._setitem_key(key=sub_key, value=value)
-            except KeyError:
-                pass
-
-        self.__dict__.__setitem__(key, value)
+            sub_item = data.get(root_key)
+            if sub_item is None and self._default is not None:
+                sub_item = self._getitem_key(key=root_key)
+            if isinstance(sub_item, Batch):
+                return sub_item._setitem_key(key=sub_key, value=value)
+
+        data[key] = value
+        _set_version(self, self._version + 1)
         return self
 
     def _setitem_index(self, index: Union[int, tuple, list], value):
@@ -416,99 +516,210 @@ class Batch(Mapping):
         """
         assert isinstance(value, Batch), "Value must be a batch if an index is given"
         for key in self.keys():
-            self.__dict__[key] = value.__dict__[key][index]
+            self._data[key] = value._data[key][index]
+        _set_version(self, self._version + 1)
         return self
 
     def __delitem__(self, k):
         assert isinstance(k, str), "Only string keys are supported"
-        self.__dict__.__delitem__(k)
+        self._data.__delitem__(k)
+        _set_version(self, self._version + 1)
 
     def __len__(self) -> int:
-        return len(list(self.keys()))
+        return len(self._data)
 
     """ ====================================== DICT METHODS ====================================== """
 
     def keys(self, depth=0):
         assert depth >= -1, "Depth must be greater or equal to -1"
         if depth == 0:
-            return (key for key in self.__dict__.keys() if not key.startswith(self.INTERNAL_MEMBER_PREFIX))
+            return self._data.keys()
+        elif depth == -1:
+            return self._flat_keys()
         else:
             keys = []
-            for key in self.__dict__.keys():
-                if not key.startswith(self.INTERNAL_MEMBER_PREFIX):
-                    if isinstance(self.__dict__[key], Batch):
-                        keys += [f"{key}.{sub_key}"
-                                 for sub_key in self.__dict__[key].keys(depth=depth - 1 if depth > 0 else -1)]
-                    else:
-                        keys.append(key)
+            for key, value in self._data.items():
+                if isinstance(value, Batch):
+                    keys += [f"{key}.{sub_key}"
+                             for sub_key in value.keys(depth=depth - 1 if depth > 0 else -1)]
+                else:
+                    keys.append(key)
             return keys
 
     def __iter__(self):
-        for key in self.keys():
-            if not key.startswith(self.INTERNAL_MEMBER_PREFIX):
-                yield key
+        return iter(self._data)
 
     def items(self):
-        for key in self.keys():
-            yield key, self.__dict__[key]
+        return self._data.items()
 
     def update(self, *args, **kwargs):
         for arg in args:
             if isinstance(arg, dict):
-                self.__dict__.update(arg)
+                self._data.update(arg)
             elif isinstance(arg, Batch):
-                self.__dict__.update(arg.__dict__)
+                self._data.update(arg._data)
             else:
                 raise NotImplementedError(f"Update not implemented for {type(arg)}")
-        self.__dict__.update(kwargs)
+        self._data.update(kwargs)
+        _set_version(self, self._version + 1)
         return self
 
     def pop(self, index):
-        return self.__dict__.pop(index)
+        _set_version(self, self._version + 1)
+        return self._data.pop(index)
 
     def __getstate__(self):
         """
         Serializes the batch
         :return:
         """
-        return self.__dict__
+        return self._data, self._default
 
-    def __setstate__(self, d):
+    def __setstate__(self, state):
         """
         Deserializes the batch
-        :param d:
+        :param state: Tuple of the members and the default constructor,
+          or the instance dictionary of batches serialized by earlier versions
         :return:
         """
-        self.__dict__ = d
+        if isinstance(state, dict):
+            state = dict(state)
+            default = state.pop("_Batch__default", None)
+            state.pop("_Batch__in_place", None)
+            state = state, default
+        data, default = state
+        _set_data(self, data)
+        _set_default(self, default)
+        _set_in_place(self, False)
+        _set_version(self, 0)
+        _set_flat_cache(self, None)
 
     """ ====================================== INTERNAL PROCESSING ====================================== """
 
+    @classmethod
+    def _from_data(cls, data):
+        """
+        Wraps a member dictionary into a new batch without constructing it.
+        The members are neither copied nor batchified.
+        :param data: Dictionary of the members
+        :return: Created batch
+        """
+        other = cls.__new__(cls)
+        _set_data(other, data)
+        _set_default(other, None)
+        _set_in_place(other, False)
+        _set_version(other, 0)
+        _set_flat_cache(other, None)
+        return other
+
+    @staticmethod
+    def _cat_map_size(value):
+        """
+        Computes the size of a concatenation map entry
+        :param value: Size of a member or a nested concatenation map
+        :return: Total size along the split dimension
+        """
+        if isinstance(value, int):
+            return value
+        if isinstance(value, OrderedDict):
+            return sum(Batch._cat_map_size(sub_value) for sub_value in value.values())
+        return 0
+
+    def _flat_keys(self):
+        """
+        Collects the keys of all leaf members, joined by '.' character.
+        The result is cached until this batch or any of its sub-batches is modified.
+        :return: Tuple of the flattened keys
+        """
+        cache = self._flat_cache
+        if cache is not None:
+            keys, version, sub_batches = cache
+            if version == self._version and all(batch._version == v for batch, v in sub_batches):
+                return keys
+
+        keys = []
+        sub_batches = []
+        stack = [("", iter(self._data.items()))]
+        while stack:
+            prefix, items = stack[-1]
+            for key, value in items:
+                if isinstance(value, Batch):
+                    sub_batches.append((value, value._version))
+                    stack.append((f"{prefix}{key}.", iter(value._data.items())))
+                    break
+                keys.append(prefix + key)
+            else:
+                stack.pop()
+
+        keys = tuple(keys)
+        _set_flat_cache(self, (keys, self._version, tuple(sub_batches)))
+        return keys
+
     def _batchify(self):
         """
         Converts all members into batches
         :return: The batchified batch
         """
-        for key in self.keys():
-            if isinstance(self[key], dict):
-                self[key] = Batch(self[key])
+        data = self._data
+        for key, value in data.items():
+            if isinstance(value, dict):
+                data[key] = Batch(value)
         return self
 
     """ ====================================== OPERATIONS ====================================== """
 
-    def __getattribute__(self, name):
+    # Batches are mutable
+    __hash__ = None
+
+    def __eq__(self, other):
+        """
+        Compares the batch member-wise.
+        :param other: Batch with the same keys, or a value which is compared to all members
+        :return: Batch of the member-wise results, or a bool if the keys of the batches differ or both are empty
+        """
+        data = self._data
+        if isinstance(other, Batch):
+            other_data = other._data
+            if data.keys() != other_data.keys():
+                return False
+            if len(data) == 0:
+                return True
+            return Batch._from_data({key: value == other_data[key] for key, value in data.items()})
+
+        if len(data) == 0:
+            return NotImplemented
+        return Batch._from_data({key: value == other for key, value in data.items()})
+
+    def __getattr__(self, name):
         """
-        Generic method called on every attribute query.
-        If the attribute is not defined, then a function call is assumed and a function pointer is returned,
+        Fallback method called only if the attribute is not found by the normal lookup.
+        If the attribute is a member of the batch, then its value is returned.
+        Otherwise, a function call is assumed and a function pointer is returned,
         which applies the function to all members.
         :param name: Attribute to be queried
         :return: Function or attribute value
         """
-        try:
-            return super().__getattribute__(name)
-        except AttributeError:
-            return self._get_member_attribute(name)
+        # Unset internal fields and protocol attributes are never dispatched to the members
+        if name in self._SLOT_NAMES or (name.startswith("__") and name.endswith("__")):
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
 
-    def _get_member_attribute(self, name, in_place=False):
+        data = self._data
+        if name in data:
+            return data[name]
+        return self._get_member_attribute(name)
+
+    def __setattr__(self, name, value):
+        """
+        Sets an attribute. Apart from the internal fields, every attribute is set as a member of the batch.
+        :param name: Attribute to be set
+        :param value: Value to set
+        """
+        if name in self._SLOT_NAMES:
+            object.__setattr__(self, name, value)
+        else:
+            self._setitem_key(key=name, value=value)
+
+    def _get_member_attribute(self, name, in_place=False, _getattr=getattr, _sentinel=_SENTINEL):
         """
         Creates a new batch with the member attributes.
         :param name: Attribute to be queried
@@ -522,14 +733,15 @@ class Batch(Mapping):
         else:
             other = Batch()
 
-        other.__in_place = in_place
+        _set_in_place(other, in_place)
 
-        for key in self.keys():
-            attr = self.__dict__[key]
-            if hasattr(attr, name):
-                other.__dict__[key] = getattr(attr, name)
-            else:
+        other_data = other._data
+        for key, attr in self._data.items():
+            member_attr = _getattr(attr, name, _sentinel)
+            if member_attr is _sentinel:
                 raise AttributeError(f"Member function {name} not implemented for {key} - {type(attr)}")
+            other_data[key] = member_attr
+        _set_version(other, other._version + 1)
         return other
 
     def __call__(self, *args, **kwargs):
@@ -540,13 +752,126 @@ class Batch(Mapping):
         :param kwargs:
         :return:
         """
-        if self.__in_place:
+        if self._in_place:
             other = self
         else:
             other = Batch()
 
-        for key in self.keys():
-            args_for_key = [arg if not isinstance(arg, Batch) else arg[key] for arg in args]
-            kwargs_for_key = {k: val if not isinstance(val, Batch) else val[key] for k, val in kwargs.items()}
-            other.__dict__[key] = self.__dict__[key](*args_for_key, **kwargs_for_key)
+        other_data = other._data
+        batch_cls, _isinstance = Batch, isinstance
+        for key, fn in self._data.items():
+            args_for_key = [arg if not _isinstance(arg, batch_cls) else arg[key] for arg in args]
+            kwargs_for_key = {k: val if not _isinstance(val, batch_cls) else val[key] for k, val in kwargs.items()}
+            other_data[key] = fn(*args_for_key, **kwargs_for_key)
+        _set_version(other, other._version + 1)
         return other
+
+
+# Setters of the internal fields, which bypass Batch.__setattr__ on the hot paths
+_set_data = Batch._data.__set__
+_set_default = Batch._default.__set__
+_set_in_place = Batch._in_place.__set__
+_set_version = Batch._version.__set__
+_set_flat_cache = Batch._flat_cache.__set__
+
+
+""" ====================================== OPERATORS ====================================== """
+
+_UNARY_OPERATORS = (
+    "__not__", "__abs__", "__index__", "__inv__", "__invert__", "__neg__", "__pos__")
+
+_BINARY_OPERATORS = (
+    "__add__", "__and__", "__concat__", "__floordiv__", "__lshift__", "__mod__", "__mul__",
+    "__or__", "__pow__", "__rshift__", "__sub__", "__truediv__", "__xor__",
+
+    # Reverse operators
+    "__radd__", "__rand__", "__rmul__",
+    "__ror__", "__rsub__", "__rxor__")
+
+_INPLACE_OPERATORS = (
+    "__iadd__", "__iand__", "__iconcat__", "__ifloordiv__", "__ilshift__", "__imod__", "__imul__",
+    "__ior__", "__ipow__", "__irshift__", "__isub__", "__itruediv__", "__ixor__")
+
+
+def _make_unary_operator(name):
+    """
+    Creates a unary operator, which applies the operator of all members
+    :param name: Name of the operator
+    :return: Operator function
+    """
+    _getattr, _sentinel = getattr, _SENTINEL
+
+    def operator(self):
+        data = self._data
+        if len(data) == 0:
+            raise AttributeError("Cannot get member function of empty batch")
+
+        other_data = dict()
+        for key, value in data.items():
+            member_fn = _getattr(value, name, _sentinel)
+            if member_fn is _sentinel:
+                raise AttributeError(f"Member function {name} not implemented for {key} - {type(value)}")
+            other_data[key] = member_fn()
+        return Batch._from_data(other_data)
+
+    operator.__name__ = name
+    operator.__qualname__ = f"Batch.{name}"
+    return operator
+
+
+def _make_binary_operator(name, in_place):
+    """
+    Creates a binary operator, which applies the operator of all members.
+    If the other operand is a batch, then its member with the same key is used.
+    :param name: Name of the operator
+    :param in_place: If true, the results are stored in the batch itself
+    :return: Operator function
+    """
+    _getattr, _isinstance, _sentinel = getattr, isinstance, _SENTINEL
+
+    def operator(self, other, *args):
+        # Extra operands (e.g. the modulo of pow) are handled by the generic member function call
+        if args:
+            return self._get_member_attribute(name=name, in_place=in_place)(other, *args)
+
+        data = self._data
+        if len(data) == 0:
+            raise AttributeError("Cannot get member function of empty batch")
+
+        other_data = data if in_place else dict()
+        other_is_batch = _isinstance(other, Batch)
+        for key, value in data.items():
+            member_fn = _getattr(value, name, _sentinel)
+            if member_fn is _sentinel:
+                raise AttributeError(f"Member function {name} not implemented for {key} - {type(value)}")
+            other_data[key] = member_fn(other._getitem_key(key) if other_is_batch else other)
+
+        if in_place:
+            _set_version(self, self._version + 1)
+            return self
+        return Batch._from_data(other_data)
+
+    operator.__name__ = name
+    operator.__qualname__ = f"Batch.{name}"
+    return operator
+
+
+# Set the operation functions once, at class definition time
+for _name in _UNARY_OPERATORS:
+    setattr(Batch, _name, _make_unary_operator(_name))
+
+for _name in _BINARY_OPERATORS:
+    setattr(Batch, _name, _make_binary_operator(_name, in_place=False))
+
+for _name in _INPLACE_OPERATORS:
+    setattr(Batch, _name, _make_binary_operator(_name, in_place=True))
+
+del _name
+
+
+""" ====================================== INDEXING ====================================== """
+
+_GETITEM_HANDLERS = {
+    str: "_getitem_key",
+    int: "_getitem_index",
+}
@@ -1,16 +1,48 @@
+import sys
 from typing import Optional, Dict, Union, Type, Tuple, Callable
 from .batch import Batch
 
-try:
-    from torch.utils.data._utils.collate import default_collate_fn_map, collate
+__all__ = ["collate_batch_fn", "install_torch_patch"]
 
+# Collate function of PyTorch, set on installation to keep PyTorch out of the import of this module
+_collate = None
 
-    def collate_batch_fn(batch, *, collate_fn_map: Optional[Dict[Union[Type, Tuple[Type, ...]], Callable]] = None):
-        elem = batch[0]
-        return Batch(**{key: collate([getattr(d, key) for d in batch], collate_fn_map=collate_fn_map)
-                        for key in vars(elem) if not key.startswith("_")})
 
+def collate_batch_fn(batch, *, collate_fn_map: Optional[Dict[Union[Type, Tuple[Type, ...]], Callable]] = None):
+    elem = batch[0]
+    keys = [key for key in elem._data if not key.startswith("_")]
 
+    # Gather the members of all samples in a single pass
+    columns = {key: [] for key in keys}
+    for sample in batch:
+        sample_data = sample._data
+        for key in keys:
+            columns[key].append(sample_data[key])
+
+    collate = _collate
+    if collate is None:
+        # The function is used directly in a custom collate function map without installing the patch
+        from torch.utils.data._utils.collate import collate
+    return Batch(**{key: collate(column, collate_fn_map=collate_fn_map) for key, column in columns.items()})
+
+
+def install_torch_patch():
+    """
+    Registers the batch collate function in the default collate function map of PyTorch,
+    so the default DataLoader collation merges batches member-wise.
+    :return: True if the patch is installed, False if PyTorch is not available
+    """
+    global _collate
+    try:
+        from torch.utils.data._utils.collate import default_collate_fn_map, collate
+    except ImportError:
+        return False
+
+    _collate = collate
     default_collate_fn_map[Batch] = collate_batch_fn
-except ImportError:
-    pass
+    return True
+
+
+# PyTorch is expensive to import, so the patch is only installed automatically if it is already loaded
+if "torch" in sys.modules:
+    install_torch_patch()
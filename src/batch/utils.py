@@ -1,3 +1,70 @@
+import numbers
+import sys
+from itertools import accumulate
+
+
 def split_list(tensor, chunk_size, dim=0):
-    assert dim == 0, "Only dim=0 split is supported for now"
-    return [tensor[i:i + chunk_size] for i in range(0, len(tensor), chunk_size)]
+    # Arrays and tensors can only exist if their module is already imported, so it is never imported here
+    np = sys.modules.get("numpy")
+    if np is not None and isinstance(tensor, np.ndarray):
+        return _split_array(np, tensor, chunk_size, dim)
+
+    torch = sys.modules.get("torch")
+    if torch is not None and isinstance(tensor, torch.Tensor):
+        return list(torch.split(tensor, chunk_size, dim))
+
+    assert dim == 0, "Only dim=0 split is supported for generic sequences"
+    if isinstance(chunk_size, numbers.Integral):
+        return [tensor[i:i + chunk_size] for i in range(0, len(tensor), chunk_size)]
+
+    # A list of section sizes is given
+    splits = []
+    start = 0
+    for size in chunk_size:
+        splits.append(tensor[start:start + size])
+        start += size
+    return splits
+
+
+def _split_array(np, array, chunk_size, dim):
+    # Splits a NumPy array with a single np.split call, following the torch.split semantics
+    if isinstance(chunk_size, numbers.Integral):
+        return np.split(array, range(chunk_size, array.shape[dim], chunk_size), axis=dim)
+
+    assert all(size >= 0 for size in chunk_size) and sum(chunk_size) == array.shape[dim], \
+        f"Split sizes {list(chunk_size)} must be non-negative and sum up to the size {array.shape[dim]} of dim {dim}"
+    return np.split(array, list(accumulate(chunk_size))[:-1], axis=dim)
+
+
+def stack_list(tensors, dim=0):
+    # Stacks NumPy arrays or PyTorch tensors of the same type, shape and dtype, otherwise None is returned
+    if len(tensors) == 0:
+        return None
+    first = tensors[0]
+    first_type = type(first)
+
+    # Only arrays and tensors are stacked, so shape and dtype are only compared for them
+    np = sys.modules.get("numpy")
+    torch = sys.modules.get("torch")
+    is_array = np is not None and first_type is np.ndarray
+    is_tensor = torch is not None and issubclass(first_type, torch.Tensor)
+    if not (is_array or is_tensor):
+        return None
+
+    if not all(type(tensor) is first_type and tensor.shape == first.shape and tensor.dtype == first.dtype
+               for tensor in tensors):
+        return None
+
+    if is_array:
+        return np.stack(tensors, axis=dim)
+    if all(tensor.device == first.device for tensor in tensors):
+        return torch.stack(tensors, dim=dim)
+    return None
+
+
+def unstack(tensor, dim=0):
+    # Splits a stacked NumPy array or PyTorch tensor back into views along the stacked dimension
+    np = sys.modules.get("numpy")
+    if np is not None and isinstance(tensor, np.ndarray):
+        return list(np.moveaxis(tensor, dim, 0))
+    return list(tensor.unbind(dim))
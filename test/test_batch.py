@@ -1,12 +1,20 @@
+import copyreg
+import importlib
 import os
+import pickle
 import sys
+import types
+import weakref
 
 import pytest
 from argparse import Namespace
+from collections import OrderedDict
 import numpy as np
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
 from batch import Batch
+from batch.utils import split_list
+import batch.torch_patch
 
 """ ====================================== INSTANTIATION ====================================== """
 
@@ -18,6 +26,41 @@ def test_batch_init():
     assert test_batch.__dict__["b"] == 2
 
 
+def test_batch_slots():
+    test_batch = Batch(a=1, b=2)
+    ref = weakref.ref(test_batch)
+
+    assert ref() is test_batch
+    assert vars(test_batch) == {"a": 1, "b": 2}
+
+
+def test_batch_set_attribute():
+    test_batch = Batch(a=1)
+    test_batch.a = 5
+    test_batch.z = 3
+
+    assert test_batch["a"] == 5
+    assert test_batch.z == 3
+    assert list(test_batch.keys(depth=-1)) == ["a", "z"]
+
+
+class _SubBatch(Batch):
+    __slots__ = ("extra",)
+
+
+def test_batch_subclass():
+    test_batch = _SubBatch(a=1)
+    test_batch.extra = 2
+
+    assert vars(test_batch) == {"a": 1}
+    assert test_batch.extra == 2
+    assert type(test_batch.copy(deep=False)) is _SubBatch
+
+    with pytest.raises(TypeError):
+        class _DictBatch(Batch):
+            pass
+
+
 def test_batch_dict():
     data = {"a": 1, "b": 2}
     test_batch = Batch.from_dict(data)
@@ -26,6 +69,103 @@ def test_batch_dict():
     assert test_batch.__dict__["b"] == 2
 
 
+def test_batch_pickle():
+    test_batch = Batch(a=1, b={"c": 2})
+    batch_out = pickle.loads(pickle.dumps(test_batch))
+
+    assert list(batch_out.keys()) == ["a", "b"]
+    assert batch_out["a"] == 1
+    assert batch_out["b.c"] == 2
+
+
+def test_batch_tensor():
+    data = np.arange(10)
+    test_batch = Batch.from_tensor(data, OrderedDict(a=2, b=OrderedDict(c=3, d=1), e=4))
+
+    assert np.allclose(test_batch["a"], np.array([0, 1]))
+    assert np.allclose(test_batch["b.c"], np.array([2, 3, 4]))
+    assert np.allclose(test_batch["b.d"], np.array([5]))
+    assert np.allclose(test_batch["e"], np.array([6, 7, 8, 9]))
+
+
+def test_batch_list():
+    test_batch = Batch.from_batch_list(Batch(a=1, b=Batch(c=3)), Batch(a=2, b=Batch(c=4)))
+
+    assert list(test_batch.keys()) == ["a", "b"]
+    assert test_batch["a"] == [1, 2]
+    assert test_batch["b.c"] == [3, 4]
+
+    test_batch = Batch.from_batch_list({"a": 1}, {"a": 2})
+    assert test_batch.to_dict() == {"a": [1, 2]}
+
+
+def test_batch_copy():
+    test_batch = Batch(a=1, b=Batch(c=np.zeros(3)), d=[1, 2])
+    batch_out = test_batch.copy()
+    batch_out["b.c"][0] = 1
+    batch_out["d"].append(3)
+
+    assert batch_out["a"] == 1
+    assert np.allclose(test_batch["b.c"], np.zeros(3))
+    assert test_batch["d"] == [1, 2]
+
+
+def test_batch_tensor_dim():
+    data = np.arange(12).reshape(2, 6)
+    test_batch = Batch.from_tensor(data, OrderedDict(a=1, b=3), dim=1)
+
+    assert np.allclose(test_batch["a"], np.array([[0], [6]]))
+    assert np.allclose(test_batch["b"], np.array([[1, 2, 3], [7, 8, 9]]))
+
+
+def test_batch_copy_shallow():
+    test_batch = Batch(a=1, default=list)
+    assert list(test_batch.keys(depth=-1)) == ["a"]
+
+    batch_out = test_batch.copy(deep=False)
+    batch_out["z"] = 2
+
+    assert list(test_batch.keys()) == ["a"]
+    assert list(test_batch.keys(depth=-1)) == ["a"]
+    assert list(batch_out.keys(depth=-1)) == ["a", "z"]
+    assert batch_out["y"] == []
+
+
+def test_batch_dict_read_only():
+    test_batch = Batch(a=1)
+    with pytest.raises(TypeError):
+        vars(test_batch)["z"] = 2
+
+    assert list(test_batch.keys()) == ["a"]
+
+
+class _LegacyBatch:
+    """ Pickles like a batch serialized by earlier versions, which stored their instance dictionary """
+    def __reduce__(self):
+        return copyreg._reconstructor, (Batch, object, None), {"_Batch__default": list, "_Batch__in_place": False, "a": 1}
+
+
+def test_batch_pickle_legacy():
+    batch_out = pickle.loads(pickle.dumps(_LegacyBatch()))
+
+    assert list(batch_out.keys()) == ["a"]
+    assert batch_out["a"] == 1
+    assert batch_out["b"] == []
+
+
+def test_batch_tensor_size_mismatch():
+    with pytest.raises(AssertionError):
+        Batch.from_tensor(np.arange(4), OrderedDict(a=2, b=3))
+
+
+def test_split_list_numpy_int():
+    splits = split_list(np.arange(6), np.int64(2))
+    assert [split.tolist() for split in splits] == [[0, 1], [2, 3], [4, 5]]
+
+    splits = split_list(list(range(6)), np.int64(4))
+    assert splits == [[0, 1, 2, 3], [4, 5]]
+
+
 """ ====================================== INDEXING ====================================== """
 
 
@@ -60,6 +200,69 @@ def test_batch_get_int_slice():
     assert np.allclose(batch_out["b"], np.array([12, 15, 18]))
 
 
+def test_batch_contains():
+    test_batch = Batch(a=1, b=Batch(c=2))
+
+    assert "a" in test_batch
+    assert "b.c" in test_batch
+    assert "d" not in test_batch
+    assert len(test_batch) == 2
+    assert test_batch.remap({"b.c": "c"})["c"] == 2
+    assert "b.d" not in test_batch
+
+    test_batch = Batch(a=1, b=Batch(c=2, default=list), default=list)
+    assert "x" not in test_batch
+    assert "b.x" not in test_batch
+    assert list(test_batch.keys(depth=-1)) == ["a", "b.c"]
+    assert test_batch.remap({"x": "y"})["y"] is None
+
+
+def test_batch_keys_recursive():
+    test_batch = Batch(a=1, b=Batch(c=2))
+    assert list(test_batch.keys(depth=-1)) == ["a", "b.c"]
+
+    test_batch["b"]["d"] = 3
+    assert list(test_batch.keys(depth=-1)) == ["a", "b.c", "b.d"]
+
+    del test_batch["a"]
+    assert list(test_batch.keys(depth=-1)) == ["b.c", "b.d"]
+
+
+def test_batch_set_str():
+    test_batch = Batch(a=1, b=Batch(c=2))
+    test_batch["b.d"] = 3
+    test_batch["e.f"] = 4
+
+    assert test_batch["b"]["d"] == 3
+    assert test_batch.__dict__["e.f"] == 4
+
+    test_batch = Batch(default=Batch)
+    test_batch["a.b"] = 1
+    assert test_batch["a"]["b"] == 1
+
+
+def test_batch_query_wildcard():
+    test_batch = Batch(image_a=1, image_b=2, mask_a=3, meta=Batch(image_c=4))
+
+    assert list(test_batch.query_wildcard("image_*").keys()) == ["image_a", "image_b"]
+    assert list(test_batch.query_wildcard(["*_a", "meta.*"]).keys()) == ["image_a", "mask_a", "meta.image_c"]
+    assert len(test_batch.query_wildcard([])) == 0
+
+
+class _UpperBatch(Batch):
+    __slots__ = ()
+
+    def _getitem_key(self, key: str):
+        return super()._getitem_key(key.upper())
+
+
+def test_batch_get_subclass():
+    test_batch = _UpperBatch(A=1)
+
+    assert test_batch["a"] == 1
+    assert test_batch[None] is test_batch
+
+
 """ ====================================== OPERATORS ====================================== """
 
 
@@ -98,9 +301,151 @@ def test_batch_operation_binary(op):
     assert test_batch_3.b == getattr(b_1, op)(b_2)
 
 
+def test_batch_operation_scalar():
+    test_batch = Batch(a=1, b=2)
+
+    assert (test_batch * 2 + 1).to_dict() == {"a": 3, "b": 5}
+    assert (10 - test_batch).to_dict() == {"a": 9, "b": 8}
+
+
+def test_batch_operation_in_place():
+    test_batch = Batch(a=np.ones(3), b=np.zeros(3))
+    batch_out = test_batch
+    batch_out += test_batch
+
+    assert batch_out is test_batch
+    assert np.allclose(test_batch["a"], np.full(3, 2))
+    assert np.allclose(test_batch["b"], np.zeros(3))
+
+
+def test_batch_operation_eq():
+    test_batch = Batch(a=1, b=Batch(c=np.arange(3)))
+
+    batch_out = test_batch == Batch(a=1, b=Batch(c=np.array([0, 0, 2])))
+    assert batch_out["a"]
+    assert np.array_equal(batch_out["b.c"], np.array([True, False, True]))
+    assert (test_batch == 1)["a"]
+
+    assert (test_batch == Batch(a=1)) is False
+    assert (Batch() == Batch()) is True
+    assert Batch() != 1
+
+
+def test_batch_member_underscore():
+    test_batch = Batch(_a=1)
+    test_batch._b = 2
+
+    assert test_batch._a == 1
+    assert test_batch._b == 2
+    assert Batch(a=Namespace(_x=1))._x.a == 1
+
+    # Protocol attributes are not dispatched to the members
+    assert not hasattr(Batch(a=np.arange(3)), "__array_interface__")
+
+
 def test_batch_member_value():
     test_batch_1 = Batch(a=Namespace(x=1), b=Namespace(x=2))
 
     test_batch_2 = test_batch_1.x
     assert test_batch_2.a == 1
     assert test_batch_2.b == 2
+
+
+""" ====================================== PROCESSING ====================================== """
+
+
+def test_batch_flatten():
+    test_batch = Batch(a=1, b=Batch(c=2, d=Batch(e=3)), f=4)
+    batch_out = test_batch.flatten()
+
+    assert list(batch_out.items()) == [("a", 1), ("b.c", 2), ("b.d.e", 3), ("f", 4)]
+    assert test_batch.to_dict() == {"a": 1, "b": {"c": 2, "d": {"e": 3}}, "f": 4}
+
+
+def test_batch_map_filter():
+    test_batch = Batch(a=1, b=Batch(c=2, d=Batch(e=3)))
+
+    assert test_batch.map(lambda x: x * 2).to_dict() == {"a": 2, "b": {"c": 4, "d": {"e": 6}}}
+    assert test_batch.filter(lambda x: x > 1).to_dict() == {"b": {"c": 2, "d": {"e": 3}}}
+
+
+def test_batch_deep():
+    test_batch = Batch(x=0)
+    for _ in range(sys.getrecursionlimit() + 100):
+        test_batch = Batch(n=test_batch)
+
+    assert list(test_batch.flatten().values()) == [0]
+    assert list(test_batch.map(lambda x: x + 1).flatten().values()) == [1]
+
+
+def test_batch_vmap():
+    test_batch = Batch(a=np.arange(6).reshape(2, 3), b=np.ones((2, 3)))
+    batch_out = test_batch.vmap(np.multiply, 2)
+
+    assert np.allclose(batch_out["a"], np.arange(6).reshape(2, 3) * 2)
+    assert np.allclose(batch_out["b"], np.full((2, 3), 2))
+
+    batch_out = test_batch.vmap(np.sum, axis=-1, stack_axis=1)
+    assert np.allclose(batch_out["a"], np.array([3, 12]))
+    assert np.allclose(batch_out["b"], np.array([3, 3]))
+
+    # Members which cannot be stacked fall back to map
+    test_batch = Batch(a=np.arange(3), b=np.arange(4))
+    batch_out = test_batch.vmap(np.negative)
+    assert np.allclose(batch_out["b"], -np.arange(4))
+
+    assert Batch(a=1, b=2).vmap(lambda x: x + 1).to_dict() == {"a": 2, "b": 3}
+    assert Batch(a="x", b="y").vmap(str.upper).to_dict() == {"a": "X", "b": "Y"}
+    assert Batch(a=[1], b=[2, 3]).vmap(len).to_dict() == {"a": 1, "b": 2}
+    assert Batch(a=Batch(x=1), b=Batch(x=2)).vmap(lambda x: x * 2).to_dict() == {"a": {"x": 2}, "b": {"x": 4}}
+
+
+""" ====================================== TORCH PATCH ====================================== """
+
+
+def _stub_torch_collate(monkeypatch):
+    # Minimal stand-in for the PyTorch collate module, dispatching on the default collate function map
+    collate_module = types.ModuleType("torch.utils.data._utils.collate")
+    collate_module.default_collate_fn_map = {}
+
+    def collate(batch, *, collate_fn_map=None):
+        for elem_type, collate_fn in (collate_fn_map or {}).items():
+            if isinstance(batch[0], elem_type):
+                return collate_fn(batch, collate_fn_map=collate_fn_map)
+        return list(batch)
+
+    collate_module.collate = collate
+    for name in ["torch", "torch.utils", "torch.utils.data", "torch.utils.data._utils"]:
+        monkeypatch.setitem(sys.modules, name, types.ModuleType(name))
+    monkeypatch.setitem(sys.modules, collate_module.__name__, collate_module)
+    return collate_module
+
+
+def test_torch_patch_unavailable(monkeypatch):
+    monkeypatch.setitem(sys.modules, "torch.utils.data._utils.collate", None)
+    assert not batch.torch_patch.install_torch_patch()
+
+
+def test_torch_patch_auto_install(monkeypatch):
+    with monkeypatch.context() as context:
+        collate_module = _stub_torch_collate(context)
+        torch_patch = importlib.reload(batch.torch_patch)
+
+        assert collate_module.default_collate_fn_map[Batch] is torch_patch.collate_batch_fn
+        batch_out = collate_module.collate([Batch(a=1, b=Batch(c=2)), Batch(a=3, b=Batch(c=4))],
+                                           collate_fn_map=collate_module.default_collate_fn_map)
+        assert batch_out.to_dict() == {"a": [1, 3], "b": {"c": [2, 4]}}
+    importlib.reload(batch.torch_patch)
+
+
+def test_torch_patch_not_installed(monkeypatch):
+    torch_patch = batch.torch_patch
+    monkeypatch.setattr(torch_patch, "_collate", None)
+    collate_module = _stub_torch_collate(monkeypatch)
+
+    collate_fn_map = {Batch: torch_patch.collate_batch_fn}
+    batch_out = collate_module.collate([Batch(a=1), Batch(a=2)], collate_fn_map=collate_fn_map)
+    assert batch_out.to_dict() == {"a": [1, 2]}
+
+    batch_out = collate_module.collate([_SubBatch(a=1), _SubBatch(a=2)], collate_fn_map=collate_fn_map)
+    assert batch_out.to_dict() == {"a": [1, 2]}